@@ -0,0 +1,456 @@
+"""
+ApiCharge Client Helpers
+========================
+
+Shared helpers for the ApiCharge Python examples in this directory:
+quote lookup and the 4-step nanosubscription purchase flow, plus the
+pooled HTTP session every example sends its requests through.
+
+Keep this file next to the example scripts; they import it directly.
+
+Requirements:
+    pip install stellar-sdk requests
+    pip install pybase64 orjson  # optional, faster base64 and JSON
+"""
+
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import re
+import ssl
+import sys
+import threading
+import time
+from binascii import a2b_hex
+from pathlib import Path
+from urllib.parse import quote_from_bytes, urlsplit
+import certifi
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from nacl.signing import SigningKey
+
+try:
+    # optional SIMD-accelerated drop-in for base64
+    from pybase64 import b64decode, b64encode_as_string, urlsafe_b64encode
+except ImportError:
+    from base64 import b64decode, b64encode, urlsafe_b64encode
+
+    def b64encode_as_string(s: bytes) -> str:
+        return b64encode(s).decode('ascii')
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads  # optional, faster JSON
+except ImportError:
+    import json
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    json_loads = json.loads
+
+# Progress and errors from the helpers and the example scripts all go through
+# this logger; configure_logging() writes it to stdout as bare messages
+logger = logging.getLogger("apicharge")
+
+# The per-step progress of purchase_access_token; see quiet_purchase_steps()
+purchase_logger = logger.getChild("purchase")
+
+
+@contextlib.contextmanager
+def quiet_purchase_steps():
+    """
+    Keep only warnings and errors from purchase_access_token inside the block.
+
+    Concurrent purchases would interleave their unlabeled "Step n" lines;
+    callers log one labeled line per finished purchase instead.
+    """
+    level = purchase_logger.level
+    purchase_logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        purchase_logger.setLevel(level)
+
+
+def configure_logging(stream=None) -> None:
+    """Send "apicharge" log records to `stream` (stdout by default), unformatted."""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+# =============================================================================
+# HTTP SESSION
+# =============================================================================
+
+# Set APICHARGE_CA_FILE to a PEM bundle to trust only that CA (or leaf)
+# certificate for the ApiCharge node instead of certifi, e.g. to pin your
+# own node. The pin wins over REQUESTS_CA_BUNDLE and per-call verify paths.
+# Third-party hosts opt out of the pin with trust_public_cas().
+_CA_FILE = os.environ.get("APICHARGE_CA_FILE")
+
+
+@functools.lru_cache(maxsize=None)
+def _build_ssl_context(ca_path: str) -> ssl.SSLContext:
+    """
+    Build the TLS context shared by every connection that trusts `ca_path`.
+
+    `ca_path` is a PEM bundle (certifi by default) or a directory of hashed
+    certificates. Contexts are cached by path and never loaded into again,
+    so each bundle is parsed once and trust stores never mix.
+    """
+    if os.path.isdir(ca_path):
+        context = ssl.create_default_context(capath=ca_path)
+    else:
+        context = ssl.create_default_context(cafile=ca_path)
+    context.set_ciphers("ECDHE+AESGCM:ECDHE+CHACHA20")
+    context.options |= ssl.OP_NO_COMPRESSION
+    return context
+
+
+class _SSLContextAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections reuse prebuilt SSLContexts.
+
+    Connections trust `ca_path`. A string `verify` (e.g. REQUESTS_CA_BUNDLE)
+    gets its own context for that bundle instead, as with plain requests,
+    unless the adapter is `pinned`: then `ca_path` is always used.
+    """
+
+    def __init__(self, ca_path: str, pinned: bool = False, **kwargs):
+        self._ca_path = ca_path
+        self._pinned = pinned
+        super().__init__(**kwargs)
+
+    def _context_for(self, verify) -> ssl.SSLContext:
+        if isinstance(verify, str) and not self._pinned:
+            return _build_ssl_context(verify)
+        return _build_ssl_context(self._ca_path)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = _build_ssl_context(self._ca_path)
+        super().init_poolmanager(*args, **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if verify is False:
+            # urllib3 switches the pool's context to CERT_NONE; let it build
+            # a throwaway one rather than touch a shared, verifying context
+            pool_kwargs["ssl_context"] = None
+        else:
+            # Key the pool on the context to use, not on a CA path that
+            # urllib3 would load into whichever context the pool holds
+            pool_kwargs.pop("ca_certs", None)
+            pool_kwargs.pop("ca_cert_dir", None)
+            pool_kwargs["ssl_context"] = self._context_for(verify)
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if verify is not False:
+            # Trust anchors already live in the pool's context; a path left
+            # here would be loaded into that shared context on every connection
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+def _new_adapter(ca_path: str, pinned: bool = False) -> _SSLContextAdapter:
+    return _SSLContextAdapter(
+        ca_path,
+        pinned,
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+    )
+
+
+# One pooled session per interpreter: every call reuses the same
+# keep-alive connection, so the TLS handshake is only paid once.
+SESSION = requests.Session()
+SESSION.mount("https://", _new_adapter(_CA_FILE or certifi.where(), pinned=bool(_CA_FILE)))
+
+
+def trust_public_cas(url_prefix: str) -> None:
+    """
+    Verify session requests under `url_prefix` (e.g. a Horizon server)
+    against certifi even when APICHARGE_CA_FILE pins the ApiCharge node.
+    """
+    if _CA_FILE:
+        SESSION.mount(url_prefix, _new_adapter(certifi.where()))
+
+# Responses are small, already-compact JSON: ask for them uncompressed so
+# urllib3 skips the gzip decode wrapper on every body
+SESSION.headers["Accept-Encoding"] = "identity"
+
+# Request bodies are serialized up front with json_dumps and sent as raw data.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# How the access token is packed into the apicharge header: "percent" is the
+# URL-encoded JSON every server accepts; "base64url" is a shorter unpadded
+# base64url JSON blob for servers that support it
+TOKEN_ENCODING = os.environ.get("APICHARGE_TOKEN_ENCODING", "percent")
+
+# Route quotes are cached here between runs (see get_quotes_cached)
+QUOTE_CACHE_DIR = Path.home() / ".cache" / "apicharge"
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that paces requests to the ApiCharge server.
+
+    Allows `rate` requests per second with bursts of up to `capacity`, and
+    pauses entirely when the server's rate-limit headers say to back off.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1) -> None:
+        """Block until `n` tokens are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = max(self._blocked_until - now, (n - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Pause from Retry-After and X-RateLimit-* response headers.
+
+        Only a Retry-After or an exhausted quota (Remaining < 1) blocks, and
+        then until the stated time. A quota that is merely running down is
+        left alone: X-RateLimit-Reset can be hours away, and spreading what
+        is left over it would stall every call of a short session.
+        """
+        retry_after = _parse_seconds(headers.get("Retry-After"))
+        remaining = _parse_seconds(headers.get("X-RateLimit-Remaining"))
+        reset = _parse_seconds(headers.get("X-RateLimit-Reset"))
+
+        # X-RateLimit-Reset is either seconds until reset or a Unix timestamp
+        if reset is not None and reset > 1_000_000_000:
+            reset -= time.time()
+
+        with self._lock:
+            now = time.monotonic()
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if remaining is not None and remaining < 1 and reset is not None and reset > 0:
+                self._blocked_until = max(self._blocked_until, now + reset)
+
+
+def _parse_seconds(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None  # e.g. an HTTP-date Retry-After, which ApiCharge does not send
+
+
+# One bucket per access token, since ApiCharge meters each token on its own;
+# requests that carry no token (purchases, quotes) get one per host and path
+_BUCKETS: dict[str, TokenBucket] = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def _bucket_for(url: str, headers) -> TokenBucket:
+    key = (headers or {}).get("apicharge")
+    if not key:
+        parts = urlsplit(url)
+        key = f"{parts.netloc}{parts.path}"
+    with _BUCKETS_LOCK:
+        bucket = _BUCKETS.get(key)
+        if bucket is None:
+            bucket = _BUCKETS[key] = TokenBucket(rate=10, capacity=10)
+        return bucket
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST through the shared session, paced by the client-side rate limiter."""
+    bucket = _bucket_for(url, kwargs.get("headers"))
+    bucket.acquire()
+    response = SESSION.post(url, **kwargs)
+    bucket.update_from_headers(response.headers)
+    return response
+
+
+def send(prepared: requests.PreparedRequest, **kwargs) -> requests.Response:
+    """Send a prepared request through the shared session, paced like post()."""
+    # Session.send skips the environment lookup Session.request does, so pick
+    # up REQUESTS_CA_BUNDLE, proxies etc. here the same way post() does
+    settings = SESSION.merge_environment_settings(
+        prepared.url, kwargs.pop("proxies", {}), kwargs.pop("stream", None),
+        kwargs.pop("verify", None), kwargs.pop("cert", None),
+    )
+    bucket = _bucket_for(prepared.url, prepared.headers)
+    bucket.acquire()
+    response = SESSION.send(prepared, **settings, **kwargs)
+    bucket.update_from_headers(response.headers)
+    return response
+
+
+# =============================================================================
+# HELPER FUNCTIONS
+# =============================================================================
+
+def read_json(response: requests.Response):
+    """Decode a JSON response body straight from its raw bytes, skipping response.text."""
+    return json_loads(response.content)
+
+
+def get_quotes(server_url: str) -> dict:
+    """
+    Fetch available route quotes from the server.
+
+    Quotes are kept as the plain decoded JSON: each one is posted back
+    verbatim as `routeQuote`, so every field the server sent (including
+    ones this client never reads) must survive the round-trip.
+    """
+    response = SESSION.get(f"{server_url}/apicharge/quote", timeout=30)
+    response.raise_for_status()
+    return read_json(response)
+
+
+def get_quotes_cached(server_url: str, ttl: float = 30) -> dict:
+    """
+    Fetch route quotes, reusing a copy cached on disk for up to `ttl` seconds.
+
+    Prices change on the order of minutes, so back-to-back runs can skip the
+    quote round-trip. The cache is best-effort and keyed by server URL.
+    """
+    key = hashlib.sha256(server_url.encode('utf-8')).hexdigest()[:16]
+    path = QUOTE_CACHE_DIR / f"quotes-{key}.json"
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            return json_loads(path.read_bytes())
+    except (OSError, ValueError):
+        pass  # missing, unreadable or corrupt cache: fetch fresh quotes
+
+    quotes = get_quotes(server_url)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(json_dumps(quotes))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return quotes
+
+
+def index_quotes(quotes: dict) -> dict[str, dict]:
+    """
+    Index quotes by full route ID, so repeated lookups skip the list scan.
+
+    A route can carry several quotes (e.g. a short cheap plan and a longer
+    one); the index keeps the first one the server lists, which is the
+    quote a linear scan of the list would have picked.
+    """
+    index = {}
+    for quote in quotes.get("quotes", []):
+        route_id = quote.get("signableEntity", {}).get("routeId")
+        if route_id is not None:
+            index.setdefault(route_id, quote)
+    return index
+
+
+def find_quote(quote_index: dict[str, dict], route_id: str) -> dict | None:
+    """Find a quote in an index_quotes() index by exact, then partial, route ID."""
+    quote = quote_index.get(route_id)
+    if quote is None:
+        quote = next((q for rid, q in quote_index.items() if route_id in rid), None)
+    return quote
+
+
+def purchase_access_token(server_url: str, route_quote: dict, public_key: str, signing_key: SigningKey) -> str:
+    """
+    Complete the 4-step nanosubscription purchase flow:
+    1. Request purchase instruction
+    2. Sign the authorization
+    3. Submit purchase
+    4. Sign the access token
+
+    `signing_key` is the client's libsodium key, built once by the caller
+    with SigningKey(keypair.raw_secret_key()) and reused for every signature.
+    """
+    purchase_logger.info("  Step 1: Requesting purchase instruction...")
+
+    purchase_request = {
+        "clientPublicKey": public_key,
+        "routeQuote": route_quote
+    }
+
+    response = post(
+        f"{server_url}/apicharge/nanosubscription/PurchaseInstruction",
+        data=json_dumps(purchase_request), headers=JSON_HEADERS, timeout=60
+    )
+    if not response.ok:
+        purchase_logger.error(f"  ERROR: {response.status_code} - {response.text}")
+        response.raise_for_status()
+
+    purchase_instruction = read_json(response)
+
+    purchase_logger.info("  Step 2: Signing authorization...")
+    auth_to_sign = purchase_instruction.get("authorisationToSign", "")
+    # Hex or base64; decode exactly once, by whichever alphabet matches.
+    # Odd-length hex-looking strings can only be base64, which is then
+    # decoded strictly so a malformed authorisation fails here, not server-side
+    if len(auth_to_sign) % 2 == 0 and _HEX_RE.match(auth_to_sign):
+        auth_bytes = a2b_hex(auth_to_sign)
+    else:
+        auth_bytes = b64decode(auth_to_sign, validate=True)
+    signed_auth = signing_key.sign(auth_bytes).signature
+    purchase_instruction["authorisationToSign"] = b64encode_as_string(signed_auth)
+
+    purchase_logger.info("  Step 3: Purchasing access token...")
+    response = post(
+        f"{server_url}/apicharge/nanosubscription/Purchase",
+        data=json_dumps(purchase_instruction), headers=JSON_HEADERS, timeout=60
+    )
+    if not response.ok:
+        purchase_logger.error(f"  ERROR: {response.status_code} - {response.text}")
+        response.raise_for_status()
+
+    access_token = read_json(response)
+
+    purchase_logger.info("  Step 4: Signing access token...")
+    signable_entity = access_token.get("signableEntity", {})
+    signature_to_sign = signable_entity.get("signature", "")
+
+    if signature_to_sign:
+        sig_bytes = b64decode(signature_to_sign)
+        token_signature = signing_key.sign(sig_bytes).signature
+        access_token["signature"] = b64encode_as_string(token_signature)
+
+    # URL-encode the token for use in headers
+    token_json = json_dumps(access_token)
+    if TOKEN_ENCODING == "base64url":
+        return urlsafe_b64encode(token_json).rstrip(b'=').decode('ascii')
+    return quote_from_bytes(token_json, safe=_TOKEN_SAFE_BYTES)
+
+
+# =============================================================================
+# UTILITY FUNCTIONS
+# =============================================================================
+
+_HEX_RE = re.compile(r'\A[0-9a-fA-F]+\Z')
+
+# Bytes left unescaped in the percent-encoded token: JSON punctuation plus
+# the base64 '/' and '=' that fill the signatures. All are header-safe and
+# pass through URL-decoding unchanged; '+' must stay escaped, since
+# form-style decoders would turn it into a space
+_TOKEN_SAFE_BYTES = b'{}":,/='
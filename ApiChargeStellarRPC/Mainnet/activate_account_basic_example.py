@@ -12,208 +12,269 @@ For full activation with trustlines, see activate_account_full_example.py
 
 Requirements:
     pip install stellar-sdk requests
+    pip install pybase64 orjson  # optional, faster base64 and JSON
+
+    Keep _apicharge_client.py (shared helpers) next to this script.
 
 Usage:
     python activate_account_basic_example.py --secret YOUR_SECRET_KEY
+    python activate_account_basic_example.py --secret YOUR_SECRET_KEY --count 10
 
 The payer account must have USDC balance for the activation fee.
 """
 
 import argparse
-import base64
-import json
-import urllib.parse
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from nacl.signing import SigningKey
 from stellar_sdk import Keypair
 
+from _apicharge_client import (
+    configure_logging,
+    find_quote,
+    get_quotes_cached,
+    index_quotes,
+    json_dumps,
+    logger,
+    post,
+    purchase_access_token,
+    quiet_purchase_steps,
+    read_json,
+)
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
 SERVER_URL = "https://mainnet.stellar.apicharge.com"
 
-# =============================================================================
-# HELPER FUNCTIONS
-# =============================================================================
-
-def get_quotes(server_url: str) -> dict:
-    """Fetch available route quotes from the server."""
-    response = requests.get(f"{server_url}/apicharge/quote", verify=True, timeout=30)
-    response.raise_for_status()
-    return response.json()
-
+# Stellar Expert account page
+_EXPERT_URL = "https://stellar.expert/explorer/public/account/{}".format
 
-def find_quote_by_route_id(quotes: dict, route_id_substring: str) -> dict | None:
-    """Find a quote by partial route ID match."""
-    for quote in quotes.get("quotes", []):
-        signable = quote.get("signableEntity", {})
-        if route_id_substring in signable.get("routeId", ""):
-            return quote
-    return None
+# Banner line around headings and results
+_BAR = "=" * 60
 
+# Upper bound on concurrent activations with --count (matches the session's
+# connection pool size, so no worker waits for a free socket).
+MAX_CONCURRENT_ACTIVATIONS = 16
 
-def purchase_access_token(server_url: str, route_quote: dict, keypair: Keypair) -> str:
-    """Complete the 4-step nanosubscription purchase flow."""
-    print("  Step 1: Requesting purchase instruction...")
-
-    purchase_request = {
-        "clientPublicKey": keypair.public_key,
-        "routeQuote": route_quote
-    }
+# =============================================================================
+# BATCH ACTIVATION
+# =============================================================================
 
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/PurchaseInstruction",
-        json=purchase_request, verify=True, timeout=60
-    )
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-    purchase_instruction = response.json()
-
-    print("  Step 2: Signing authorization...")
-    auth_to_sign = purchase_instruction.get("authorisationToSign", "")
-    auth_bytes = bytes.fromhex(auth_to_sign) if not _is_base64(auth_to_sign) else base64.b64decode(auth_to_sign)
-    signed_auth = keypair.sign(auth_bytes)
-    purchase_instruction["authorisationToSign"] = base64.b64encode(signed_auth).decode('utf-8')
-
-    print("  Step 3: Purchasing access token...")
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/Purchase",
-        json=purchase_instruction, verify=True, timeout=60
+def activate_account(
+    server_url: str,
+    activate_quote: dict,
+    payer_public_key: str,
+    payer_signing_key: SigningKey,
+    new_account: Keypair
+) -> dict:
+    """Purchase an activation token and run Phase 1 for a single new account."""
+    token = purchase_access_token(server_url, activate_quote, payer_public_key, payer_signing_key)
+    response = post(
+        f"{server_url}/apicharge/stablecoin/activate-account",
+        headers={"apicharge": token, "Content-Type": "application/json"},
+        data=json_dumps({"publicKey": new_account.public_key}),
+        timeout=60
     )
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
+    response.raise_for_status()
+    return read_json(response)
 
-    access_token = response.json()
 
-    print("  Step 4: Signing access token...")
-    signable_entity = access_token.get("signableEntity", {})
-    signature_to_sign = signable_entity.get("signature", "")
+def activate_batch(server_url: str, payer_public_key: str, payer_signing_key: SigningKey, count: int) -> None:
+    """
+    Activate `count` freshly generated accounts concurrently.
 
-    if signature_to_sign:
-        sig_bytes = base64.b64decode(signature_to_sign)
-        token_signature = keypair.sign(sig_bytes)
-        access_token["signature"] = base64.b64encode(token_signature).decode('utf-8')
+    Each activation is an independent purchase + Phase 1 chain, so the
+    chains run side by side on a bounded thread pool sharing one session.
+    """
+    new_accounts = [Keypair.random() for _ in range(count)]
 
-    token_json = json.dumps(access_token, separators=(',', ':'))
-    return urllib.parse.quote(token_json, safe='')
+    # IMPORTANT: Save the new accounts' secret keys!
+    logger.info(_BAR)
+    logger.info("SAVE THESE SECRET KEYS - You will need them to use the accounts!")
+    for new_account in new_accounts:
+        logger.info(f"{new_account.public_key}  {new_account.secret}")
+    logger.info(_BAR)
+    logger.info("")
 
+    logger.info("[1/2] Fetching available quotes...")
+    quote_index = index_quotes(get_quotes_cached(server_url))
 
-def _is_base64(s: str) -> bool:
-    try:
-        base64.b64decode(s)
-        return True
-    except:
-        return False
+    activate_quote = find_quote(quote_index, "stablecoin-activate-account")
+    if not activate_quote:
+        logger.error("ERROR: stablecoin-activate-account route not found")
+        return
 
+    price = activate_quote["signableEntity"]["microUnitPrice"] / 1_000_000
+    logger.info(f"       Activation price: ${price:.4f} USDC x {count}")
+    logger.info("")
+
+    logger.info(f"[2/2] Activating {count} accounts (Phase 1)...")
+    activated = 0
+    workers = min(count, MAX_CONCURRENT_ACTIVATIONS)
+    with quiet_purchase_steps(), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                activate_account, server_url, activate_quote, payer_public_key, payer_signing_key, new_account
+            ): new_account
+            for new_account in new_accounts
+        }
+        for future in as_completed(futures):
+            new_account = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"       FAILED {new_account.public_key}: {e}")
+                continue
+            activated += 1
+            logger.info(f"       OK     {new_account.public_key} (TX {result.get('transactionHash', 'unknown')})")
+
+    logger.info("")
+    logger.info(_BAR)
+    logger.info(f"Activated {activated}/{count} accounts (Phase 1 only, NO trustlines)")
+    logger.info(_BAR)
 
 # =============================================================================
 # MAIN SCRIPT
 # =============================================================================
 
-def main():
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='ApiCharge Basic Account Activation Example')
     parser.add_argument('--secret', '-s', required=True, help='Payer Stellar secret key (starts with S)')
     parser.add_argument('--server', default=SERVER_URL, help='ApiCharge server URL')
     parser.add_argument('--new-secret', help='Optional: Provide secret key for new account instead of generating')
-    args = parser.parse_args()
+    parser.add_argument('--count', '-n', type=int, default=1, help='Number of new accounts to activate concurrently (default: 1)')
+    parser.add_argument('--debug', action='store_true', help='Print a full traceback on unexpected errors')
+    return parser
+
 
-    print("=" * 60)
-    print("ApiCharge Basic Account Activation Example")
-    print("(Phase 1 Only - XLM reserve, NO trustlines)")
-    print("=" * 60)
-    print()
+_PARSER = _build_parser()
+
+
+def main():
+    args = _PARSER.parse_args()
+
+    logger.info(_BAR)
+    logger.info("ApiCharge Basic Account Activation Example")
+    logger.info("(Phase 1 Only - XLM reserve, NO trustlines)")
+    logger.info(_BAR)
+    logger.info("")
 
     try:
         payer_keypair = Keypair.from_secret(args.secret)
     except Exception as e:
-        print(f"ERROR: Invalid payer secret key: {e}")
+        logger.error(f"ERROR: Invalid payer secret key: {e}")
+        return
+
+    # Expand the seed into a libsodium signing key once; every signature reuses it
+    payer_signing_key = SigningKey(payer_keypair.raw_secret_key())
+
+    if args.count < 1:
+        logger.error("ERROR: --count must be at least 1")
+        return
+
+    if args.count > 1:
+        if args.new_secret:
+            logger.error("ERROR: --new-secret cannot be combined with --count")
+            return
+        logger.info(f"Payer:       {payer_keypair.public_key}")
+        logger.info(f"Server:      {args.server}")
+        logger.info("")
+        try:
+            activate_batch(args.server, payer_keypair.public_key, payer_signing_key, args.count)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"ERROR: Network error: {e}")
+        except Exception as e:
+            logger.error(f"ERROR: {e}")
+            if args.debug:
+                traceback.print_exc()
         return
 
     # Generate or use provided new account
     if args.new_secret:
         try:
             new_account = Keypair.from_secret(args.new_secret)
-            print("Using provided new account keypair")
+            logger.info("Using provided new account keypair")
         except Exception as e:
-            print(f"ERROR: Invalid new account secret key: {e}")
+            logger.error(f"ERROR: Invalid new account secret key: {e}")
             return
     else:
         new_account = Keypair.random()
-        print("Generated new account keypair")
+        logger.info("Generated new account keypair")
 
-    print(f"Payer:       {payer_keypair.public_key}")
-    print(f"New Account: {new_account.public_key}")
-    print(f"Server:      {args.server}")
-    print()
+    logger.info(f"Payer:       {payer_keypair.public_key}")
+    logger.info(f"New Account: {new_account.public_key}")
+    logger.info(f"Server:      {args.server}")
+    logger.info("")
 
     # IMPORTANT: Save the new account's secret key!
-    print("=" * 60)
-    print("SAVE THIS SECRET KEY - You will need it to use the account!")
-    print(f"Secret: {new_account.secret}")
-    print("=" * 60)
-    print()
+    logger.info(_BAR)
+    logger.info("SAVE THIS SECRET KEY - You will need it to use the account!")
+    logger.info(f"Secret: {new_account.secret}")
+    logger.info(_BAR)
+    logger.info("")
 
     try:
         # Step 1: Fetch quotes
-        print("[1/3] Fetching available quotes...")
-        quotes = get_quotes(args.server)
+        logger.info("[1/3] Fetching available quotes...")
+        quote_index = index_quotes(get_quotes_cached(args.server))
 
-        activate_quote = find_quote_by_route_id(quotes, "stablecoin-activate-account")
+        activate_quote = find_quote(quote_index, "stablecoin-activate-account")
         if not activate_quote:
-            print("ERROR: stablecoin-activate-account route not found")
+            logger.error("ERROR: stablecoin-activate-account route not found")
             return
 
         price = activate_quote["signableEntity"]["microUnitPrice"] / 1_000_000
-        print(f"       Activation price: ${price:.4f} USDC")
-        print()
+        logger.info(f"       Activation price: ${price:.4f} USDC")
+        logger.info("")
 
         # Step 2: Purchase access token
-        print("[2/3] Purchasing activation access token...")
-        token = purchase_access_token(args.server, activate_quote, payer_keypair)
-        print("       Access token acquired!")
-        print()
+        logger.info("[2/3] Purchasing activation access token...")
+        token = purchase_access_token(args.server, activate_quote, payer_keypair.public_key, payer_signing_key)
+        logger.info("       Access token acquired!")
+        logger.info("")
 
         # Step 3: Activate account (Phase 1 only)
-        print("[3/3] Activating account (Phase 1)...")
-        response = requests.post(
+        logger.info("[3/3] Activating account (Phase 1)...")
+        response = post(
             f"{args.server}/apicharge/stablecoin/activate-account",
             headers={"apicharge": token, "Content-Type": "application/json"},
-            json={"publicKey": new_account.public_key},
+            data=json_dumps({"publicKey": new_account.public_key}),
             timeout=60
         )
 
         if not response.ok:
-            print(f"ERROR: Activation failed: {response.status_code}")
-            print(f"       {response.text}")
+            logger.error(f"ERROR: Activation failed: {response.status_code}")
+            logger.info(f"       {response.text}")
             return
 
-        result = response.json()
-
-        print()
-        print("=" * 60)
-        print("SUCCESS! Account activated (Phase 1 complete)")
-        print("=" * 60)
-        print(f"Status:     {result.get('status', 'unknown')}")
-        print(f"Account ID: {result.get('accountId', 'unknown')}")
-        print(f"TX Hash:    {result.get('transactionHash', 'unknown')}")
-        print()
-        print("The account now exists with XLM base reserve.")
-        print("NOTE: Trustlines are NOT established.")
-        print("      To receive USDC/EURC, use activate_account_full_example.py")
-        print()
-        print(f"View on Stellar Expert:")
-        print(f"https://stellar.expert/explorer/public/account/{new_account.public_key}")
+        result = read_json(response)
+
+        logger.info("")
+        logger.info(_BAR)
+        logger.info("SUCCESS! Account activated (Phase 1 complete)")
+        logger.info(_BAR)
+        logger.info(f"Status:     {result.get('status', 'unknown')}")
+        logger.info(f"Account ID: {result.get('accountId', 'unknown')}")
+        logger.info(f"TX Hash:    {result.get('transactionHash', 'unknown')}")
+        logger.info("")
+        logger.info("The account now exists with XLM base reserve.")
+        logger.info("NOTE: Trustlines are NOT established.")
+        logger.info("      To receive USDC/EURC, use activate_account_full_example.py")
+        logger.info("")
+        logger.info(f"View on Stellar Expert:")
+        logger.info(_EXPERT_URL(new_account.public_key))
 
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error: {e}")
+        logger.error(f"ERROR: Network error: {e}")
     except Exception as e:
-        print(f"ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"ERROR: {e}")
+        if args.debug:
+            traceback.print_exc()
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -11,6 +11,9 @@ Phase 2: Client signs trustline transaction, server fee-bumps and submits
 
 Requirements:
     pip install stellar-sdk requests
+    pip install pybase64 orjson  # optional, faster base64 and JSON
+
+    Keep _apicharge_client.py (shared helpers) next to this script.
 
 Usage:
     python activate_account_full_example.py --secret YOUR_SECRET_KEY
@@ -19,182 +22,140 @@ The payer account must have USDC balance for the activation fee.
 """
 
 import argparse
-import base64
-import json
-import urllib.parse
+import traceback
+from binascii import a2b_hex
 import requests
+from nacl.signing import SigningKey
 from stellar_sdk import Keypair
 
+from _apicharge_client import (
+    SESSION,
+    b64encode_as_string,
+    configure_logging,
+    find_quote,
+    get_quotes_cached,
+    index_quotes,
+    json_dumps,
+    logger,
+    purchase_access_token,
+    read_json,
+    send,
+)
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
 SERVER_URL = "https://mainnet.stellar.apicharge.com"
 
-# =============================================================================
-# HELPER FUNCTIONS
-# =============================================================================
-
-def get_quotes(server_url: str) -> dict:
-    """Fetch available route quotes from the server."""
-    response = requests.get(f"{server_url}/apicharge/quote", verify=True, timeout=30)
-    response.raise_for_status()
-    return response.json()
-
-
-def find_quote_by_route_id(quotes: dict, route_id_substring: str) -> dict | None:
-    """Find a quote by partial route ID match."""
-    for quote in quotes.get("quotes", []):
-        signable = quote.get("signableEntity", {})
-        if route_id_substring in signable.get("routeId", ""):
-            return quote
-    return None
-
-
-def purchase_access_token(server_url: str, route_quote: dict, keypair: Keypair) -> str:
-    """Complete the 4-step nanosubscription purchase flow."""
-    print("  Step 1: Requesting purchase instruction...")
-
-    purchase_request = {
-        "clientPublicKey": keypair.public_key,
-        "routeQuote": route_quote
-    }
-
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/PurchaseInstruction",
-        json=purchase_request, verify=True, timeout=60
-    )
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-    purchase_instruction = response.json()
-
-    print("  Step 2: Signing authorization...")
-    auth_to_sign = purchase_instruction.get("authorisationToSign", "")
-    auth_bytes = bytes.fromhex(auth_to_sign) if not _is_base64(auth_to_sign) else base64.b64decode(auth_to_sign)
-    signed_auth = keypair.sign(auth_bytes)
-    purchase_instruction["authorisationToSign"] = base64.b64encode(signed_auth).decode('utf-8')
-
-    print("  Step 3: Purchasing access token...")
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/Purchase",
-        json=purchase_instruction, verify=True, timeout=60
-    )
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-    access_token = response.json()
-
-    print("  Step 4: Signing access token...")
-    signable_entity = access_token.get("signableEntity", {})
-    signature_to_sign = signable_entity.get("signature", "")
-
-    if signature_to_sign:
-        sig_bytes = base64.b64decode(signature_to_sign)
-        token_signature = keypair.sign(sig_bytes)
-        access_token["signature"] = base64.b64encode(token_signature).decode('utf-8')
-
-    token_json = json.dumps(access_token, separators=(',', ':'))
-    return urllib.parse.quote(token_json, safe='')
-
-
-def _is_base64(s: str) -> bool:
-    try:
-        base64.b64decode(s)
-        return True
-    except:
-        return False
+# Stellar Expert account page
+_EXPERT_URL = "https://stellar.expert/explorer/public/account/{}".format
 
+# Banner line around headings and results
+_BAR = "=" * 60
 
 # =============================================================================
 # MAIN SCRIPT
 # =============================================================================
 
-def main():
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='ApiCharge Full Account Activation Example')
     parser.add_argument('--secret', '-s', required=True, help='Payer Stellar secret key (starts with S)')
     parser.add_argument('--server', default=SERVER_URL, help='ApiCharge server URL')
     parser.add_argument('--new-secret', help='Optional: Provide secret key for new account instead of generating')
     parser.add_argument('--testnet', action='store_true', help='Use testnet instead of mainnet')
-    args = parser.parse_args()
+    parser.add_argument('--debug', action='store_true', help='Print a full traceback on unexpected errors')
+    return parser
+
+
+_PARSER = _build_parser()
+
+
+def main():
+    args = _PARSER.parse_args()
 
-    print("=" * 60)
-    print("ApiCharge Full Account Activation Example")
-    print("(Phase 1 + Phase 2 - XLM reserve + USDC/EURC trustlines)")
-    print("=" * 60)
-    print()
+    logger.info(_BAR)
+    logger.info("ApiCharge Full Account Activation Example")
+    logger.info("(Phase 1 + Phase 2 - XLM reserve + USDC/EURC trustlines)")
+    logger.info(_BAR)
+    logger.info("")
 
     try:
         payer_keypair = Keypair.from_secret(args.secret)
     except Exception as e:
-        print(f"ERROR: Invalid payer secret key: {e}")
+        logger.error(f"ERROR: Invalid payer secret key: {e}")
         return
 
+    # Expand the seed into a libsodium signing key once; every signature reuses it
+    payer_signing_key = SigningKey(payer_keypair.raw_secret_key())
+
     # Generate or use provided new account
     if args.new_secret:
         try:
             new_account = Keypair.from_secret(args.new_secret)
-            print("Using provided new account keypair")
+            logger.info("Using provided new account keypair")
         except Exception as e:
-            print(f"ERROR: Invalid new account secret key: {e}")
+            logger.error(f"ERROR: Invalid new account secret key: {e}")
             return
     else:
         new_account = Keypair.random()
-        print("Generated new account keypair")
+        logger.info("Generated new account keypair")
 
-    print(f"Payer:       {payer_keypair.public_key}")
-    print(f"New Account: {new_account.public_key}")
-    print(f"Server:      {args.server}")
-    print(f"Network:     {'Testnet' if args.testnet else 'Mainnet'}")
-    print()
+    logger.info(f"Payer:       {payer_keypair.public_key}")
+    logger.info(f"New Account: {new_account.public_key}")
+    logger.info(f"Server:      {args.server}")
+    logger.info(f"Network:     {'Testnet' if args.testnet else 'Mainnet'}")
+    logger.info("")
 
     # IMPORTANT: Save the new account's secret key!
-    print("=" * 60)
-    print("SAVE THIS SECRET KEY - You will need it to use the account!")
-    print(f"Secret: {new_account.secret}")
-    print("=" * 60)
-    print()
+    logger.info(_BAR)
+    logger.info("SAVE THIS SECRET KEY - You will need it to use the account!")
+    logger.info(f"Secret: {new_account.secret}")
+    logger.info(_BAR)
+    logger.info("")
 
     try:
         # Step 1: Fetch quotes
-        print("[1/5] Fetching available quotes...")
-        quotes = get_quotes(args.server)
+        logger.info("[1/5] Fetching available quotes...")
+        quote_index = index_quotes(get_quotes_cached(args.server))
 
-        activate_quote = find_quote_by_route_id(quotes, "stablecoin-activate-account")
+        activate_quote = find_quote(quote_index, "stablecoin-activate-account")
         if not activate_quote:
-            print("ERROR: stablecoin-activate-account route not found")
+            logger.error("ERROR: stablecoin-activate-account route not found")
             return
 
         price = activate_quote["signableEntity"]["microUnitPrice"] / 1_000_000
-        print(f"       Activation price: ${price:.4f} USDC")
-        print()
+        logger.info(f"       Activation price: ${price:.4f} USDC")
+        logger.info("")
 
         # Step 2: Purchase access token
-        print("[2/5] Purchasing activation access token...")
-        token = purchase_access_token(args.server, activate_quote, payer_keypair)
-        print("       Access token acquired!")
-        print()
-
-        # Step 3: Phase 1 - Create account
-        print("[3/5] Phase 1: Creating account...")
-        response = requests.post(
+        logger.info("[2/5] Purchasing activation access token...")
+        token = purchase_access_token(args.server, activate_quote, payer_keypair.public_key, payer_signing_key)
+        logger.info("       Access token acquired!")
+        logger.info("")
+
+        # Both phases POST to the same URL with the same headers, so prepare
+        # the request once and only swap the JSON body between them
+        activate_request = SESSION.prepare_request(requests.Request(
+            "POST",
             f"{args.server}/apicharge/stablecoin/activate-account",
             headers={"apicharge": token, "Content-Type": "application/json"},
-            json={"publicKey": new_account.public_key},
-            timeout=60
-        )
+        ))
+
+        # Step 3: Phase 1 - Create account
+        logger.info("[3/5] Phase 1: Creating account...")
+        activate_request.prepare_body(json_dumps({"publicKey": new_account.public_key}), None)
+        response = send(activate_request, timeout=60)
 
         if not response.ok:
-            print(f"ERROR: Phase 1 failed: {response.status_code}")
-            print(f"       {response.text}")
+            logger.error(f"ERROR: Phase 1 failed: {response.status_code}")
+            logger.info(f"       {response.text}")
             return
 
-        phase1_result = response.json()
-        print(f"       Status: {phase1_result.get('status', 'unknown')}")
-        print(f"       TX Hash: {phase1_result.get('transactionHash', 'unknown')}")
-        print()
+        phase1_result = read_json(response)
+        logger.info(f"       Status: {phase1_result.get('status', 'unknown')}")
+        logger.info(f"       TX Hash: {phase1_result.get('transactionHash', 'unknown')}")
+        logger.info("")
 
         # Check if Phase 2 data is available
         ticket = phase1_result.get("ticket")
@@ -202,70 +163,72 @@ def main():
         trustline_hash = phase1_result.get("trustlineTransactionHash")
 
         if not ticket or not trustline_xdr:
-            print("WARNING: Phase 2 data not returned")
-            print("         Account created but trustlines not available")
-            print("         This may indicate the account already had trustlines")
+            logger.warning("WARNING: Phase 2 data not returned")
+            logger.info("         Account created but trustlines not available")
+            logger.info("         This may indicate the account already had trustlines")
             return
 
-        print(f"       Trustline TX Hash: {trustline_hash}")
-        print(f"       Ticket received: {ticket[:50]}...")
-        print()
+        logger.info(f"       Trustline TX Hash: {trustline_hash}")
+        logger.info(f"       Ticket received: {ticket[:50]}...")
+        logger.info("")
 
         # Step 4: Sign trustline transaction HASH with NEW account's key
         # Using Option B: RawSignature - simpler than parsing XDR
-        print("[4/5] Phase 2: Signing trustline transaction hash...")
-        print(f"       Signing with new account: {new_account.public_key}")
+        logger.info("[4/5] Phase 2: Signing trustline transaction hash...")
+        logger.info(f"       Signing with new account: {new_account.public_key}")
+
+        # A transaction hash is 32 bytes (64 hex chars); fail fast on anything else
+        if not trustline_hash or len(trustline_hash) != 64:
+            logger.error(f"ERROR: Unexpected trustline transaction hash: {trustline_hash!r}")
+            return
 
         # Sign the transaction hash directly (64-byte Ed25519 signature)
-        hash_bytes = bytes.fromhex(trustline_hash)
-        raw_signature = new_account.sign(hash_bytes)
-        raw_signature_base64 = base64.b64encode(raw_signature).decode('utf-8')
+        new_signing_key = SigningKey(new_account.raw_secret_key())
+        raw_signature = new_signing_key.sign(a2b_hex(trustline_hash)).signature
+        raw_signature_base64 = b64encode_as_string(raw_signature)
 
-        print("       Transaction hash signed!")
-        print()
+        logger.info("       Transaction hash signed!")
+        logger.info("")
 
         # Step 5: Submit Phase 2 with raw signature (server wraps into envelope)
-        print("[5/5] Phase 2: Submitting signed trustline transaction...")
-        response = requests.post(
-            f"{args.server}/apicharge/stablecoin/activate-account",
-            headers={"apicharge": token, "Content-Type": "application/json"},
-            json={
-                "publicKey": new_account.public_key,
-                "ticket": ticket,
-                "callerAccount": new_account.public_key,
-                "rawSignature": raw_signature_base64
-            },
-            timeout=60
-        )
+        logger.info("[5/5] Phase 2: Submitting signed trustline transaction...")
+        activate_request.prepare_body(json_dumps({
+            "publicKey": new_account.public_key,
+            "ticket": ticket,
+            "callerAccount": new_account.public_key,
+            "rawSignature": raw_signature_base64
+        }), None)
+        response = send(activate_request, timeout=60)
 
         if response.ok:
-            print()
-            print("=" * 60)
-            print("SUCCESS! Account fully activated with trustlines!")
-            print("=" * 60)
-            print(f"Account: {new_account.public_key}")
-            print()
-            print("The account now has:")
-            print("  - XLM base reserve")
-            print("  - USDC trustline (ready to receive USDC)")
-            print("  - EURC trustline (ready to receive EURC)")
-            print()
-            print(f"View on Stellar Expert:")
-            print(f"https://stellar.expert/explorer/public/account/{new_account.public_key}")
+            logger.info("")
+            logger.info(_BAR)
+            logger.info("SUCCESS! Account fully activated with trustlines!")
+            logger.info(_BAR)
+            logger.info(f"Account: {new_account.public_key}")
+            logger.info("")
+            logger.info("The account now has:")
+            logger.info("  - XLM base reserve")
+            logger.info("  - USDC trustline (ready to receive USDC)")
+            logger.info("  - EURC trustline (ready to receive EURC)")
+            logger.info("")
+            logger.info(f"View on Stellar Expert:")
+            logger.info(_EXPERT_URL(new_account.public_key))
         else:
-            print(f"ERROR: Phase 2 failed: {response.status_code}")
-            print(f"       {response.text}")
-            print()
-            print("Note: Phase 1 succeeded - account exists with XLM")
-            print("      Trustlines may need to be added manually")
+            logger.error(f"ERROR: Phase 2 failed: {response.status_code}")
+            logger.info(f"       {response.text}")
+            logger.info("")
+            logger.info("Note: Phase 1 succeeded - account exists with XLM")
+            logger.info("      Trustlines may need to be added manually")
 
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error: {e}")
+        logger.error(f"ERROR: Network error: {e}")
     except Exception as e:
-        print(f"ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"ERROR: {e}")
+        if args.debug:
+            traceback.print_exc()
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
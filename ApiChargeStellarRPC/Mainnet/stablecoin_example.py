@@ -8,6 +8,9 @@ the ApiCharge Stablecoin-Native endpoints on mainnet.
 
 Requirements:
     pip install stellar-sdk requests
+    pip install pybase64 orjson  # optional, faster base64 and JSON
+
+    Keep _apicharge_client.py (shared helpers) next to this script.
 
 Usage:
     python stablecoin_example.py --secret YOUR_SECRET_KEY --recipient GXXXX... --amount 0.0001
@@ -16,17 +19,40 @@ The sender account must have USDC balance and a USDC trustline.
 """
 
 import argparse
-import json
-import urllib.parse
+import hashlib
+import struct
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from nacl.signing import SigningKey
 from stellar_sdk import (
+    Account,
     Keypair,
     Network,
+    Operation,
+    StrKey,
     TransactionBuilder,
     Asset,
     Server,
 )
 
+from _apicharge_client import (
+    SESSION,
+    b64encode_as_string,
+    configure_logging,
+    find_quote,
+    get_quotes_cached,
+    index_quotes,
+    json_dumps,
+    logger,
+    post,
+    purchase_access_token,
+    quiet_purchase_steps,
+    read_json,
+    trust_public_cas,
+)
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -36,101 +62,22 @@ DEFAULT_SERVER_URL = "https://mainnet.stellar.apicharge.com"
 
 # Mainnet USDC issuer
 USDC_ISSUER = "GA5ZSEJYB37JRC5AVCIA5MOP4RHTM335X2KGX3IHOJAPP5RE34K4KZVN"
+_USDC_ASSET = Asset("USDC", USDC_ISSUER)
 
-# =============================================================================
-# HELPER FUNCTIONS
-# =============================================================================
+# Stellar Expert transaction page
+_EXPERT_TX_URL = "https://stellar.expert/explorer/public/tx/{}".format
 
-def get_quotes(server_url: str) -> dict:
-    """Fetch available route quotes from the server."""
-    response = requests.get(
-        f"{server_url}/apicharge/quote",
-        verify=True,
-        timeout=30
-    )
-    response.raise_for_status()
-    return response.json()
-
-
-def find_quote_by_route_id(quotes: dict, route_id_substring: str) -> dict | None:
-    """Find a quote by partial route ID match."""
-    for quote in quotes.get("quotes", []):
-        signable = quote.get("signableEntity", {})
-        if route_id_substring in signable.get("routeId", ""):
-            return quote
-    return None
-
-
-def purchase_access_token(server_url: str, route_quote: dict, keypair: Keypair) -> str:
-    """
-    Complete the 4-step nanosubscription purchase flow:
-    1. Request purchase instruction
-    2. Sign the authorization
-    3. Submit purchase
-    4. Sign the access token
-    """
-    print("  Step 1: Requesting purchase instruction...")
-
-    # Step 1: Request purchase instruction
-    purchase_request = {
-        "clientPublicKey": keypair.public_key,
-        "routeQuote": route_quote
-    }
-
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/PurchaseInstruction",  # Capital P
-        json=purchase_request,
-        verify=True,
-        timeout=60
-    )
+# Public Stellar Horizon, for account info. It is not an ApiCharge node, so
+# an APICHARGE_CA_FILE pin must not apply to it
+HORIZON_URL = "https://horizon.stellar.org"
+trust_public_cas(f"{HORIZON_URL}/")
 
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-    purchase_instruction = response.json()
-
-    print("  Step 2: Signing authorization...")
-
-    # Step 2: Sign the authorization
-    auth_to_sign = purchase_instruction.get("authorisationToSign", "")
-    auth_bytes = bytes.fromhex(auth_to_sign) if not _is_base64(auth_to_sign) else _b64decode(auth_to_sign)
-    signed_auth = keypair.sign(auth_bytes)
-    purchase_instruction["authorisationToSign"] = _b64encode(signed_auth)
-
-    print("  Step 3: Purchasing access token...")
-
-    # Step 3: Purchase the access token
-    response = requests.post(
-        f"{server_url}/apicharge/nanosubscription/Purchase",  # Capital P
-        json=purchase_instruction,
-        verify=True,
-        timeout=60
-    )
-
-    if not response.ok:
-        print(f"  ERROR: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-    access_token = response.json()
-
-    print("  Step 4: Signing access token...")
-
-    # Step 4: Sign the access token
-    signable_entity = access_token.get("signableEntity", {})
-    signature_to_sign = signable_entity.get("signature", "")
-
-    if signature_to_sign:
-        sig_bytes = _b64decode(signature_to_sign)
-        token_signature = keypair.sign(sig_bytes)
-        access_token["signature"] = _b64encode(token_signature)
-
-    # URL-encode the token for use in headers
-    token_json = json.dumps(access_token, separators=(',', ':'))
-    encoded_token = urllib.parse.quote(token_json, safe='')
-
-    return encoded_token
+# Banner line around headings and results
+_BAR = "=" * 60
 
+# =============================================================================
+# HELPER FUNCTIONS
+# =============================================================================
 
 def build_zero_fee_payment(
     sender_keypair: Keypair,
@@ -142,18 +89,20 @@ def build_zero_fee_payment(
     Build a classic USDC payment transaction with ZERO fee.
     The fee will be sponsored by ApiCharge when submitted.
     """
-    usdc_asset = Asset("USDC", USDC_ISSUER)
+    if not recipient_public.startswith("M"):
+        return _build_zero_fee_payment_fast(sender_keypair, recipient_public, amount, sequence_number)
 
+    # Muxed (M...) recipients go through the general-purpose builder
     # Build transaction with fee=0
     builder = TransactionBuilder(
-        source_account=_create_account_object(sender_keypair.public_key, sequence_number),
+        source_account=Account(sender_keypair.public_key, sequence_number),
         network_passphrase=Network.PUBLIC_NETWORK_PASSPHRASE,
         base_fee=0  # ZERO FEE - ApiCharge will sponsor
     )
 
     builder.append_payment_op(
         destination=recipient_public,
-        asset=usdc_asset,
+        asset=_USDC_ASSET,
         amount=amount
     )
 
@@ -165,207 +114,245 @@ def build_zero_fee_payment(
     return transaction.to_xdr()
 
 
+# Fixed XDR layout of the one transaction shape this script sends: a v1
+# envelope, fee 0, a 300 s time bound, no memo and a single USDC payment.
+# Only the source key, sequence, max time, destination and amount vary.
+_ENVELOPE_TYPE_TX = struct.pack(">i", 2)
+_NETWORK_ID = Network(Network.PUBLIC_NETWORK_PASSPHRASE).network_id()
+_USDC_ASSET_XDR = _USDC_ASSET.to_xdr_object().to_xdr_bytes()
+# source MuxedAccount, fee, seqNum, PRECOND_TIME bounds, MEMO_NONE,
+# 1 operation without its own source, PAYMENT, destination MuxedAccount
+_PAYMENT_TX_HEAD = struct.Struct(">i32sIqiQQiIiIi32s")
+# amount, Transaction.ext
+_PAYMENT_TX_TAIL = struct.Struct(">qi")
+# 1 DecoratedSignature: hint, 64-byte signature
+_SIGNATURES = struct.Struct(">I4sI64s")
+
+
+def _build_zero_fee_payment_fast(
+    sender_keypair: Keypair,
+    recipient_public: str,
+    amount: str,
+    sequence_number: int
+) -> str:
+    """
+    Same transaction as the TransactionBuilder path in build_zero_fee_payment,
+    packed straight into its XDR bytes; the output is byte-for-byte identical.
+    """
+    tx = _PAYMENT_TX_HEAD.pack(
+        0, sender_keypair.raw_public_key(),
+        0,
+        sequence_number + 1,  # the builder also bumps the account sequence
+        1, 0, int(time.time()) + 300,
+        0,
+        1, 0, 1,
+        0, StrKey.decode_ed25519_public_key(recipient_public),
+    ) + _USDC_ASSET_XDR + _PAYMENT_TX_TAIL.pack(Operation.to_xdr_amount(amount), 0)
+
+    tagged_tx = _ENVELOPE_TYPE_TX + tx
+    signature = sender_keypair.sign(hashlib.sha256(_NETWORK_ID + tagged_tx).digest())
+    return b64encode_as_string(
+        tagged_tx + _SIGNATURES.pack(1, sender_keypair.signature_hint(), 64, signature)
+    )
+
+
 def submit_transaction(server_url: str, access_token: str, transaction_xdr: str) -> dict:
     """Submit a signed transaction via the stablecoin submit endpoint."""
-    response = requests.post(
+    response = post(
         f"{server_url}/apicharge/stablecoin/submit-transaction",
-        headers={"apicharge": access_token},
-        json={"transactionXdr": transaction_xdr},
-        verify=True,
+        headers={"apicharge": access_token, "Content-Type": "application/json"},
+        data=json_dumps({"transactionXdr": transaction_xdr}),
         timeout=60
     )
     response.raise_for_status()
-    return response.json()
+    return read_json(response)
 
 
 def check_transaction_status(server_url: str, access_token: str, tx_hash: str) -> dict:
     """Check the status of a submitted transaction."""
-    response = requests.post(
+    response = post(
         f"{server_url}/apicharge/stablecoin/get-transaction-status",
-        headers={"apicharge": access_token},
-        json={"transactionHash": tx_hash},
-        verify=True,
+        headers={"apicharge": access_token, "Content-Type": "application/json"},
+        data=json_dumps({"transactionHash": tx_hash}),
         timeout=30
     )
     response.raise_for_status()
-    return response.json()
+    return read_json(response)
 
 
 def get_account_sequence(public_key: str) -> int:
     """Get the current sequence number for an account from Horizon."""
-    # Use public Stellar Horizon for account info
-    horizon_url = "https://horizon.stellar.org"
-    response = requests.get(
-        f"{horizon_url}/accounts/{public_key}",
+    response = SESSION.get(
+        f"{HORIZON_URL}/accounts/{public_key}",
         timeout=30
     )
     response.raise_for_status()
-    return int(response.json()["sequence"])
-
-
-# =============================================================================
-# UTILITY FUNCTIONS
-# =============================================================================
-
-import base64
-
-def _b64encode(data: bytes) -> str:
-    return base64.b64encode(data).decode('utf-8')
-
-def _b64decode(data: str) -> bytes:
-    return base64.b64decode(data)
-
-def _is_base64(s: str) -> bool:
-    try:
-        base64.b64decode(s)
-        return True
-    except:
-        return False
-
-def _create_account_object(public_key: str, sequence: int):
-    """Create an Account object for TransactionBuilder."""
-    from stellar_sdk import Account
-    return Account(public_key, sequence)
+    return int(read_json(response)["sequence"])
 
 
 # =============================================================================
 # MAIN SCRIPT
 # =============================================================================
 
-def main():
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='ApiCharge Stablecoin-Native Payment Example')
     parser.add_argument('--secret', '-s', required=True, help='Sender Stellar secret key (starts with S)')
     parser.add_argument('--recipient', '-r', required=True, help='Recipient public key (starts with G)')
     parser.add_argument('--amount', '-a', default='0.0001', help='Amount to send in USDC (default: 0.0001)')
     parser.add_argument('--server', default=DEFAULT_SERVER_URL, help='ApiCharge server URL')
-    args = parser.parse_args()
+    parser.add_argument('--debug', action='store_true', help='Print a full traceback on unexpected errors')
+    return parser
 
-    print("=" * 60)
-    print("ApiCharge Stablecoin-Native Payment Example")
-    print("=" * 60)
-    print()
+
+_PARSER = _build_parser()
+
+
+def main():
+    args = _PARSER.parse_args()
+
+    logger.info(_BAR)
+    logger.info("ApiCharge Stablecoin-Native Payment Example")
+    logger.info(_BAR)
+    logger.info("")
 
     # Create keypair from secret
     try:
         sender_keypair = Keypair.from_secret(args.secret)
     except Exception as e:
-        print(f"ERROR: Invalid secret key: {e}")
+        logger.error(f"ERROR: Invalid secret key: {e}")
         return
 
+    # Expand the seed into a libsodium signing key once; every signature reuses it
+    sender_signing_key = SigningKey(sender_keypair.raw_secret_key())
+
     recipient = args.recipient
     amount = args.amount
     server_url = args.server
 
-    print(f"Sender:    {sender_keypair.public_key}")
-    print(f"Recipient: {recipient}")
-    print(f"Amount:    {amount} USDC")
-    print(f"Server:    {server_url}")
-    print()
+    logger.info(f"Sender:    {sender_keypair.public_key}")
+    logger.info(f"Recipient: {recipient}")
+    logger.info(f"Amount:    {amount} USDC")
+    logger.info(f"Server:    {server_url}")
+    logger.info("")
 
     try:
         # Step 1: Fetch quotes
-        print("[1/6] Fetching available quotes...")
-        quotes = get_quotes(server_url)
+        logger.info("[1/5] Fetching available quotes...")
+        quote_index = index_quotes(get_quotes_cached(server_url))
 
-        # Find the stablecoin submit route
-        submit_quote = find_quote_by_route_id(quotes, "stablecoin-submit-classic-tx")
-        status_quote = find_quote_by_route_id(quotes, "stablecoin-get-tx-status")
+        # Find the submit and status routes. If a route offers several quotes
+        # (plans), this takes the first one the server lists, as the old scan did
+        submit_quote = find_quote(quote_index, "stablecoin-submit-classic-tx")
+        status_quote = find_quote(quote_index, "stablecoin-get-tx-status")
 
         if not submit_quote:
-            print("ERROR: stablecoin-submit-classic-tx route not found")
+            logger.error("ERROR: stablecoin-submit-classic-tx route not found")
             return
 
         if not status_quote:
-            print("ERROR: stablecoin-get-tx-status route not found")
+            logger.error("ERROR: stablecoin-get-tx-status route not found")
             return
 
         submit_price = submit_quote["signableEntity"]["microUnitPrice"] / 1_000_000
         status_price = status_quote["signableEntity"]["microUnitPrice"] / 1_000_000
 
-        print(f"       Submit route: ${submit_price:.2f} USDC")
-        print(f"       Status route: ${status_price:.2f} USDC")
-        print(f"       Total cost:   ${submit_price + status_price:.2f} USDC")
-        print()
-
-        # Step 2: Purchase submit access token
-        print("[2/6] Purchasing submit access token...")
-        submit_token = purchase_access_token(server_url, submit_quote, sender_keypair)
-        print("       Access token acquired!")
-        print()
-
-        # Step 3: Purchase status access token
-        print("[3/6] Purchasing status access token...")
-        status_token = purchase_access_token(server_url, status_quote, sender_keypair)
-        print("       Access token acquired!")
-        print()
-
-        # Step 4: Get account sequence number
-        print("[4/6] Fetching account sequence number...")
-        sequence = get_account_sequence(sender_keypair.public_key)
-        print(f"       Sequence: {sequence}")
-        print()
-
-        # Step 5: Build and submit transaction
-        print("[5/6] Building zero-fee transaction...")
+        logger.info(f"       Submit route: ${submit_price:.2f} USDC")
+        logger.info(f"       Status route: ${status_price:.2f} USDC")
+        logger.info(f"       Total cost:   ${submit_price + status_price:.2f} USDC")
+        logger.info("")
+
+        # Step 2: Purchase submit and status access tokens
+        # The two purchases and the Horizon sequence lookup are independent,
+        # so run all three side by side
+        logger.info("[2/5] Purchasing submit and status access tokens...")
+        # The two purchases' "Step n" lines would interleave; log one
+        # labeled line per token as it arrives instead
+        with quiet_purchase_steps(), ThreadPoolExecutor(max_workers=3) as executor:
+            sequence_future = executor.submit(get_account_sequence, sender_keypair.public_key)
+            token_futures = {
+                executor.submit(
+                    purchase_access_token, server_url, quote, sender_keypair.public_key, sender_signing_key
+                ): label
+                for label, quote in (("Submit", submit_quote), ("Status", status_quote))
+            }
+            tokens = {}
+            for future in as_completed(token_futures):
+                label = token_futures[future]
+                tokens[label] = future.result()
+                logger.info(f"       {label} access token acquired")
+        submit_token, status_token = tokens["Submit"], tokens["Status"]
+        logger.info("")
+
+        # Step 3: Get account sequence number
+        logger.info("[3/5] Fetching account sequence number...")
+        sequence = sequence_future.result()
+        logger.info(f"       Sequence: {sequence}")
+        logger.info("")
+
+        # Step 4: Build and submit transaction
+        logger.info("[4/5] Building zero-fee transaction...")
         tx_xdr = build_zero_fee_payment(
             sender_keypair,
             recipient,
             amount,
             sequence
         )
-        print("       Transaction built and signed")
-        print()
+        logger.info("       Transaction built and signed")
+        logger.info("")
 
-        print("       Submitting to ApiCharge...")
+        logger.info("       Submitting to ApiCharge...")
         submit_result = submit_transaction(server_url, submit_token, tx_xdr)
         tx_hash = submit_result.get("transactionHash")
 
         if not tx_hash:
-            print(f"ERROR: Submit failed: {submit_result}")
+            logger.error(f"ERROR: Submit failed: {submit_result}")
             return
 
-        print(f"       Transaction hash: {tx_hash}")
-        print()
+        logger.info(f"       Transaction hash: {tx_hash}")
+        logger.info("")
 
-        # Step 6: Wait for confirmation
-        print("[6/6] Waiting for confirmation...")
-        import time
+        # Step 5: Wait for confirmation
+        logger.info("[5/5] Waiting for confirmation...")
 
         for attempt in range(20):
-            time.sleep(2)
+            # Back off 0.25s, 0.5s, 1s, then every 2s: fast ledger closes are
+            # seen almost immediately, slow ones are still polled at the old pace
+            time.sleep(min(2.0, 0.25 * 2 ** attempt))
             status = check_transaction_status(server_url, status_token, tx_hash)
             status_str = status.get("status", "unknown")
             ledger = status.get("ledger", "pending")
-
-            print(f"       Attempt {attempt + 1}/20: status={status_str}, ledger={ledger}")
-
-            if status_str.lower() == "success":
-                print()
-                print("=" * 60)
-                print("SUCCESS! Transaction confirmed!")
-                print("=" * 60)
-                print(f"Hash:   {tx_hash}")
-                print(f"Ledger: {ledger}")
-                print(f"View:   https://stellar.expert/explorer/public/tx/{tx_hash}")
+            state = status_str.lower()
+
+            logger.info(f"       Attempt {attempt + 1}/20: status={status_str}, ledger={ledger}")
+
+            if state == "success":
+                logger.info("")
+                logger.info(_BAR)
+                logger.info("SUCCESS! Transaction confirmed!")
+                logger.info(_BAR)
+                logger.info(f"Hash:   {tx_hash}")
+                logger.info(f"Ledger: {ledger}")
+                logger.info(f"View:   {_EXPERT_TX_URL(tx_hash)}")
                 return
 
-            if status_str.lower() == "failed":
-                print()
-                print("ERROR: Transaction failed")
-                print(f"Result XDR: {status.get('resultXdr', 'N/A')}")
+            if state == "failed":
+                logger.info("")
+                logger.error("ERROR: Transaction failed")
+                logger.info(f"Result XDR: {status.get('resultXdr', 'N/A')}")
                 return
 
-        print()
-        print("WARNING: Transaction status unknown after 20 attempts")
-        print(f"Check manually: https://stellar.expert/explorer/public/tx/{tx_hash}")
+        logger.info("")
+        logger.warning("WARNING: Transaction status unknown after 20 attempts")
+        logger.info(f"Check manually: {_EXPERT_TX_URL(tx_hash)}")
 
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error: {e}")
+        logger.error(f"ERROR: Network error: {e}")
     except Exception as e:
-        print(f"ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"ERROR: {e}")
+        if args.debug:
+            traceback.print_exc()
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -0,0 +1,114 @@
+"""
+Checks for _apicharge_client's TLS trust handling.
+
+Two local HTTPS servers use certificates from two unrelated self-signed
+CAs, A and B, to check that an APICHARGE_CA_FILE pin is never widened by
+REQUESTS_CA_BUNDLE.
+
+Run from this directory (needs the openssl binary):
+    python -m unittest test_apicharge_client
+"""
+
+import importlib
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+import _apicharge_client
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def _ok(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = do_POST = _ok
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed(directory: str, name: str) -> tuple[str, str]:
+    cert, key = os.path.join(directory, f"{name}.pem"), os.path.join(directory, f"{name}.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def _serve(cert: str, key: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("localhost", 0), _OkHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@unittest.skipUnless(shutil.which("openssl"), "needs the openssl binary")
+class CAPinningTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.ca_a, key_a = _self_signed(cls._tmp.name, "a")
+        cls.ca_b, key_b = _self_signed(cls._tmp.name, "b")
+        cls._servers = [_serve(cls.ca_a, key_a), _serve(cls.ca_b, key_b)]
+        cls.url_a, cls.url_b = (f"https://localhost:{s.server_address[1]}/" for s in cls._servers)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls._servers:
+            server.shutdown()
+            server.server_close()
+        cls._tmp.cleanup()
+        importlib.reload(_apicharge_client)
+
+    def _client(self, **env):
+        """Reload the client as if started with `env` as its only CA settings."""
+        cleared = {k: v for k, v in os.environ.items()
+                   if k not in ("APICHARGE_CA_FILE", "REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE")}
+        patcher = mock.patch.dict(os.environ, {**cleared, **env}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        _apicharge_client._build_ssl_context.cache_clear()
+        return importlib.reload(_apicharge_client)
+
+    def _send(self, client, url):
+        return client.send(client.SESSION.prepare_request(requests.Request("POST", url)), timeout=5)
+
+    def test_pin_rejects_host_trusted_only_by_requests_ca_bundle(self):
+        client = self._client(APICHARGE_CA_FILE=self.ca_a, REQUESTS_CA_BUNDLE=self.ca_b)
+
+        self.assertEqual(client.SESSION.get(self.url_a, timeout=5).status_code, 200)
+        with self.assertRaises(requests.exceptions.SSLError):
+            client.SESSION.get(self.url_b, timeout=5)
+        with self.assertRaises(requests.exceptions.SSLError):
+            self._send(client, self.url_b)
+        with self.assertRaises(requests.exceptions.SSLError):
+            client.SESSION.get(self.url_b, timeout=5, verify=self.ca_b)
+        self.assertEqual(len(client._build_ssl_context(self.ca_a).get_ca_certs()), 1)
+
+    def test_requests_ca_bundle_replaces_default_trust_without_pin(self):
+        client = self._client(REQUESTS_CA_BUNDLE=self.ca_b)
+
+        self.assertEqual(client.SESSION.get(self.url_b, timeout=5).status_code, 200)
+        self.assertEqual(self._send(client, self.url_b).status_code, 200)
+        with self.assertRaises(requests.exceptions.SSLError):
+            client.SESSION.get(self.url_a, timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()